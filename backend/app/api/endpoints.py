@@ -1,16 +1,25 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form
-from typing import Optional
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Request
+from fastapi.responses import ORJSONResponse, Response
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
 import json
 import logging
+import orjson
+import time
+import uuid
+from pydantic import TypeAdapter, ValidationError
 from ..models.chess_models import (
     GameAnalysis, PGNInput, CoachingRequest, CoachingResponse,
     VoiceCoachingResponse, AnalysisWithVoiceResponse, HealthCheck,
-    Analysis
+    Analysis, Move, BatchAnalysisRequest, BatchAnalysisResponse
 )
 from ..services.chess_service import extract_moves_from_pgn
 from ..services.openai_service import (
-    analyze_game_with_gpt, get_coaching_response, structure_coaching_response,
-    text_to_speech, speech_to_text, check_openai_connection
+    analyze_game_with_gpt, get_coaching_response, text_to_speech,
+    speech_to_text, check_openai_connection, create_analysis_batch,
+    get_analysis_batch, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION
 )
 
 # Configure logging
@@ -20,6 +29,60 @@ logger = logging.getLogger(__name__)
 # Create router
 router = APIRouter()
 
+# Validates a list of key moments in one pass
+_ANALYSIS_LIST = TypeAdapter(List[Analysis])
+
+# Parsed games for recently submitted analysis batches, keyed by OpenAI batch id,
+# least recently used first
+BATCH_JOBS_SIZE = 256
+_batch_jobs: "OrderedDict[str, List[Tuple[List[Move], Dict]]]" = OrderedDict()
+
+def _store_batch_job(batch_id: str, games: List[Tuple[List[Move], Dict]]) -> None:
+    """Keep the parsed games of a batch for GET /analyze-batch, evicting the oldest batches."""
+    _batch_jobs[batch_id] = games
+    while len(_batch_jobs) > BATCH_JOBS_SIZE:
+        _batch_jobs.popitem(last=False)
+
+# Completed /analyze responses keyed by PGN hash, least recently used first
+ANALYSIS_CACHE_SIZE = 256
+ANALYSIS_CACHE_TTL = 24 * 60 * 60  # seconds
+_analysis_cache: "OrderedDict[str, Tuple[float, GameAnalysis]]" = OrderedDict()
+
+def _analysis_cache_key(pgn: str) -> str:
+    """Hash the PGN together with the model and prompt version that analyze it."""
+    return hashlib.sha256(
+        f"{ANALYSIS_MODEL}:{ANALYSIS_PROMPT_VERSION}:{pgn}".encode("utf-8")
+    ).hexdigest()
+
+def _get_cached_analysis(key: str) -> Optional[GameAnalysis]:
+    entry = _analysis_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, analysis = entry
+    if time.monotonic() - stored_at > ANALYSIS_CACHE_TTL:
+        del _analysis_cache[key]
+        return None
+    _analysis_cache.move_to_end(key)
+    return analysis
+
+def _store_cached_analysis(key: str, analysis: GameAnalysis) -> None:
+    _analysis_cache[key] = (time.monotonic(), analysis)
+    _analysis_cache.move_to_end(key)
+    while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+
+# Recently generated coaching audio (MP3 bytes), keyed by TTS id, least recently used first
+TTS_CACHE_SIZE = 64
+_tts_audio: "OrderedDict[str, bytes]" = OrderedDict()
+
+def _store_tts_audio(audio: bytes) -> str:
+    """Keep generated audio for GET /tts/{tts_id}, evicting the least recently used entries."""
+    tts_id = uuid.uuid4().hex
+    _tts_audio[tts_id] = audio
+    while len(_tts_audio) > TTS_CACHE_SIZE:
+        _tts_audio.popitem(last=False)
+    return tts_id
+
 @router.get("/health", response_model=HealthCheck)
 async def check_health():
     """
@@ -41,7 +104,12 @@ async def check_health():
             message=f"Service health check failed: {str(e)}"
         )
 
-@router.post("/analyze", response_model=GameAnalysis)
+@router.post(
+    "/analyze",
+    response_model=GameAnalysis,
+    response_model_exclude_none=True,
+    response_class=ORJSONResponse
+)
 async def analyze_game(pgn_input: PGNInput):
     """
     Analyze a chess game from PGN text.
@@ -49,31 +117,41 @@ async def analyze_game(pgn_input: PGNInput):
     """
     try:
         logger.info("Starting game analysis")
+        # Return the previous analysis if this exact game was analyzed recently
+        cache_key = _analysis_cache_key(pgn_input.pgn)
+        cached = _get_cached_analysis(cache_key)
+        if cached is not None:
+            logger.info("Returning cached analysis")
+            return cached
+        
         # Extract moves and metadata from PGN
         moves, metadata = extract_moves_from_pgn(pgn_input.pgn)
         
         # Get AI analysis
         analysis = await analyze_game_with_gpt(moves)
         
-        # Log the analysis response
-        logger.info("Analysis response:")
-        logger.info(json.dumps(analysis, indent=2))
+        # Log the analysis response (serialized only when debug logging is on)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Analysis response: %s", json.dumps(analysis))
         
         # Create the response
         response = GameAnalysis(
             moves=moves,
             summary=analysis["summary"],
-            key_moments=[Analysis(**moment) for moment in analysis["key_moments"]],
+            key_moments=_ANALYSIS_LIST.validate_python(analysis["key_moments"]),
             **metadata
         )
         
         # Log the final response
-        logger.info("Final response:")
-        logger.info(json.dumps(response.model_dump(), indent=2))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Final response: %s", response.model_dump_json())
         
+        _store_cached_analysis(cache_key, response)
         logger.info("Analysis completed successfully")
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in analyze_game endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -107,29 +185,41 @@ async def get_chess_coaching(request: CoachingRequest):
         # Add the current user message
         messages.append({"role": "user", "content": request.message})
         
-        # Get coaching response
-        coaching_content = await get_coaching_response(messages)
-        
-        # Structure the response
+        # Get the structured coaching response
+        structured_content = await get_coaching_response(messages)
         try:
-            structured_content = await structure_coaching_response(coaching_content)
+            coaching_response = CoachingResponse(
+                response=structured_content["text_response"],
+                suggestions=structured_content["suggestions"],
+                next_steps=structured_content.get("next_steps"),
+                evaluation=structured_content.get("evaluation")
+            )
             logger.info("Successfully structured coaching response")
-            return CoachingResponse(**structured_content)
-        except:
-            # Fallback to a simpler response if structuring fails
+            return coaching_response
+        except ValidationError as e:
+            # Fallback to a simpler response if the structure doesn't fit the model
+            logger.warning(f"Coaching response failed validation: {str(e)}")
             return CoachingResponse(
-                response=coaching_content,
+                response=str(structured_content["text_response"]),
                 suggestions=["Focus on the key points mentioned above"],
                 next_steps=["Review the advice and apply it in your next game"],
                 evaluation="Please see the main response for evaluation"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chess coaching endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/analyze-with-voice", response_model=AnalysisWithVoiceResponse)
+@router.post(
+    "/analyze-with-voice",
+    response_model=AnalysisWithVoiceResponse,
+    response_model_exclude_none=True,
+    response_class=ORJSONResponse
+)
 async def analyze_and_coach(
+    request: Request,
     pgn: str = Form(...),
     audio_file: Optional[UploadFile] = None,
     conversation_history: Optional[str] = None
@@ -141,14 +231,30 @@ async def analyze_and_coach(
     try:
         logger.info("Starting combined analysis and coaching")
         
-        # First, analyze the game
+        # First, start analyzing the game
         moves, metadata = extract_moves_from_pgn(pgn)
-        analysis = await analyze_game_with_gpt(moves)
+        analysis_task = asyncio.create_task(analyze_game_with_gpt(moves))
+        
+        # Transcribe the audio (if any) while the analysis is in flight
+        user_message = None
+        if audio_file:
+            await audio_file.seek(0)
+            stt_task = asyncio.create_task(
+                speech_to_text(audio_file.file, audio_file.filename or "audio.wav")
+            )
+            try:
+                analysis, user_message = await asyncio.gather(analysis_task, stt_task)
+            except Exception:
+                analysis_task.cancel()
+                stt_task.cancel()
+                raise
+        else:
+            analysis = await analysis_task
         
         game_analysis = GameAnalysis(
             moves=moves,
             summary=analysis["summary"],
-            key_moments=[Analysis(**moment) for moment in analysis["key_moments"]],
+            key_moments=_ANALYSIS_LIST.validate_python(analysis["key_moments"]),
             **metadata
         )
         
@@ -156,11 +262,6 @@ async def analyze_and_coach(
         if not audio_file:
             return AnalysisWithVoiceResponse(game_analysis=game_analysis)
         
-        # Process voice coaching if audio file is provided
-        audio_content = await audio_file.read()
-        
-        # Convert speech to text
-        user_message = await speech_to_text(audio_content)
         logger.info(f"Transcribed text: {user_message}")
         
         # Prepare coaching context with game analysis
@@ -180,30 +281,135 @@ Player Question/Comment: {user_message}"""}
         # Add conversation history if provided
         if conversation_history:
             try:
-                conv_history = json.loads(conversation_history)
+                conv_history = orjson.loads(conversation_history)
                 messages.extend(conv_history)
             except json.JSONDecodeError:
                 logger.warning("Invalid conversation history format")
         
-        # Get coaching response
-        coaching_text = await get_coaching_response(messages)
-        
-        # Structure the response
-        structured_content = await structure_coaching_response(coaching_text)
+        # Get the structured coaching response
+        structured_content = await get_coaching_response(messages)
         
-        # Convert response to speech
-        audio_base64 = await text_to_speech(structured_content["text_response"])
+        # Convert response to speech, served separately as raw audio
+        audio = await text_to_speech(structured_content["text_response"])
+        tts_id = _store_tts_audio(audio)
         
-        coaching_response = VoiceCoachingResponse(
-            audio_response=audio_base64,
-            **structured_content
-        )
+        tts_url = str(request.url_for("get_tts_audio", tts_id=tts_id))
+        try:
+            coaching_response = VoiceCoachingResponse(
+                tts_url=tts_url,
+                text_response=structured_content["text_response"],
+                suggestions=structured_content["suggestions"],
+                next_steps=structured_content.get("next_steps"),
+                evaluation=structured_content.get("evaluation")
+            )
+        except ValidationError as e:
+            # Fallback to a simpler response if the structure doesn't fit the model
+            logger.warning(f"Voice coaching response failed validation: {str(e)}")
+            coaching_response = VoiceCoachingResponse(
+                tts_url=tts_url,
+                text_response=str(structured_content["text_response"]),
+                suggestions=["Focus on the key points mentioned above"],
+                next_steps=["Review the advice and apply it in your next game"],
+                evaluation="Please see the main response for evaluation"
+            )
         
         return AnalysisWithVoiceResponse(
             game_analysis=game_analysis,
             coaching=coaching_response
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in combined analysis and coaching endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/tts/{tts_id}")
+async def get_tts_audio(tts_id: str):
+    """
+    Get the spoken coaching response generated by /analyze-with-voice as MP3 audio.
+    """
+    audio = _tts_audio.get(tts_id)
+    if audio is None:
+        raise HTTPException(status_code=404, detail=f"Unknown TTS id: {tts_id}")
+    _tts_audio.move_to_end(tts_id)
+    return Response(content=audio, media_type="audio/mpeg")
+
+@router.post("/analyze-batch", response_model=BatchAnalysisResponse)
+async def submit_analysis_batch(request: BatchAnalysisRequest):
+    """
+    Submit several chess games for analysis through the OpenAI Batch API.
+    Batches are cheaper than individual calls but may take up to 24 hours;
+    poll GET /analyze-batch/{batch_id} for the results.
+    """
+    try:
+        logger.info(f"Starting batch analysis of {len(request.pgns)} games")
+        if not request.pgns:
+            raise HTTPException(status_code=400, detail="No PGNs provided")
+        
+        # Parse every game up front so invalid PGNs are rejected immediately
+        games = [extract_moves_from_pgn(pgn) for pgn in request.pgns]
+        
+        batch_id, status = await create_analysis_batch([moves for moves, _ in games])
+        _store_batch_job(batch_id, games)
+        
+        return BatchAnalysisResponse(batch_id=batch_id, status=status)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in submit_analysis_batch endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get(
+    "/analyze-batch/{batch_id}",
+    response_model=BatchAnalysisResponse,
+    response_model_exclude_none=True
+)
+async def get_analysis_batch_results(batch_id: str):
+    """
+    Get the status of an analysis batch.
+    Once the batch has completed, returns the analysis of every game in submission order.
+    """
+    try:
+        games = _batch_jobs.get(batch_id)
+        if games is None:
+            raise HTTPException(status_code=404, detail=f"Unknown batch id: {batch_id}")
+        _batch_jobs.move_to_end(batch_id)
+        
+        status, analyses = await get_analysis_batch(batch_id)
+        if analyses is None:
+            return BatchAnalysisResponse(batch_id=batch_id, status=status)
+        
+        # One entry per submitted game, None where that game's analysis failed
+        game_analyses: List[Optional[GameAnalysis]] = []
+        failed_games = []
+        for index, (moves, metadata) in enumerate(games):
+            analysis = analyses.get(index)
+            game_analysis = None
+            if analysis is not None:
+                try:
+                    game_analysis = GameAnalysis(
+                        moves=moves,
+                        summary=analysis["summary"],
+                        key_moments=_ANALYSIS_LIST.validate_python(analysis["key_moments"]),
+                        **metadata
+                    )
+                except (KeyError, ValidationError) as e:
+                    logger.error(f"Batch {batch_id} game {index} has an invalid analysis: {str(e)}")
+            if game_analysis is None:
+                failed_games.append(index)
+            game_analyses.append(game_analysis)
+        
+        return BatchAnalysisResponse(
+            batch_id=batch_id,
+            status=status,
+            analyses=game_analyses,
+            failed_games=failed_games
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_analysis_batch_results endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
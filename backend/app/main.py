@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 from .api.endpoints import router
@@ -10,7 +11,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Chess Game Analyzer",
     description="AI-powered chess game analysis using GPT-4",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -26,5 +28,17 @@ app.add_middleware(
 app.include_router(router, prefix="/api")
 
 if __name__ == "__main__":
+    import os
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # uvloop is not available on Windows; fall back to the standard asyncio loop there.
+    # Batch jobs and TTS audio are kept in process memory, so only run several
+    # workers (WEB_CONCURRENCY) behind a load balancer with sticky sessions.
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    ) 
\ No newline at end of file
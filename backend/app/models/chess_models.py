@@ -1,8 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Dict, Optional
 from fastapi import UploadFile
 
 class Move(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     number: int
     white: Optional[str] = None
     black: Optional[str] = None
@@ -19,13 +21,25 @@ class Move(BaseModel):
     is_checkmate_white: bool = False  # Whether white's move gives checkmate
     is_checkmate_black: bool = False  # Whether black's move gives checkmate
 
+    @classmethod
+    def construct_empty(cls, number: int) -> "Move":
+        """
+        Create an empty move record without running validation.
+        position_fen must be set before the record is used.
+        """
+        return cls.model_construct(number=number, full_move=f"{number}.")
+
 class Analysis(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     move_number: int
     move: str
     analysis: str
     evaluation: Optional[str] = None  # e.g., "+=", "=", "-/+"
 
 class GameAnalysis(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     moves: List[Move]
     summary: str
     key_moments: List[Analysis]
@@ -36,41 +50,70 @@ class GameAnalysis(BaseModel):
     date: Optional[str] = None
 
 class HealthCheck(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     status: str
     openai_connection: bool
     message: str
 
 class PGNInput(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     pgn: str
 
 class CoachingRequest(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     message: str
     game_context: Optional[str] = None  # PGN of the current game if available
     conversation_history: Optional[List[Dict[str, str]]] = []  # Previous messages in the conversation
 
 class CoachingResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     response: str
     suggestions: List[str]
     next_steps: Optional[List[str]] = None
     evaluation: Optional[str] = None
 
 class VoiceCoachingRequest(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     audio_file: UploadFile
     game_context: Optional[str] = None
     conversation_history: Optional[List[Dict[str, str]]] = []
 
 class VoiceCoachingResponse(BaseModel):
-    audio_response: str  # Base64 encoded audio
+    model_config = ConfigDict(from_attributes=True)
+
+    tts_url: str  # URL of the spoken response (MP3), served by GET /tts/{tts_id}
     text_response: str
     suggestions: List[str]
     next_steps: Optional[List[str]] = None
     evaluation: Optional[str] = None
 
 class AnalysisWithVoiceRequest(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     pgn: str
     audio_file: Optional[UploadFile] = None
     conversation_history: Optional[List[Dict[str, str]]] = []
 
 class AnalysisWithVoiceResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     game_analysis: GameAnalysis
-    coaching: Optional[VoiceCoachingResponse] = None 
\ No newline at end of file
+    coaching: Optional[VoiceCoachingResponse] = None 
+
+class BatchAnalysisRequest(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    pgns: List[str]
+
+class BatchAnalysisResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    batch_id: str
+    status: str  # OpenAI batch status, e.g. "validating", "in_progress", "completed"
+    analyses: Optional[List[Optional[GameAnalysis]]] = None  # Available once the batch has completed, None for failed games
+    failed_games: List[int] = []  # Indices of games whose analysis failed
@@ -1,12 +1,123 @@
+import chess
 import chess.pgn
 import io
-from typing import List, Dict, Tuple
+import re
+from typing import List, Dict, Optional, Tuple
 from fastapi import HTTPException
 import logging
 from ..models.chess_models import Move
 
 logger = logging.getLogger(__name__)
 
+# Limits that bound the parsing work a single request can cause
+MAX_PGN_LENGTH = 1_000_000  # characters
+MAX_PLIES = 10_000
+
+# Cheap check for something PGN-like: a header tag or a first move number
+_PGN_START_RE = re.compile(r'\[\w+\s+"|\b1\s*\.')
+
+# Header lines, comments, escape lines and move numbers, removed before looking for
+# words python-chess would silently skip. No alternative can backtrack across a run
+# of whitespace or digits, so the scan stays linear in the input length.
+_NON_MOVETEXT_RE = re.compile(r'^[ \t]*\[.*$|^%.*$|\{[^}]*\}?|;.*$|(?<!\d)\d+\.+', re.MULTILINE)
+_UNRECOGNIZED_WORD_RE = re.compile(r'[A-Za-z]{2,}')
+
+def _find_unrecognized_word(game_text: str) -> Optional[str]:
+    """Return the first word in a game's text that is not a header, move, result or annotation."""
+    movetext = _NON_MOVETEXT_RE.sub(" ", game_text.lstrip("\ufeff"))
+    movetext = chess.pgn.MOVETEXT_REGEX.sub(" ", movetext)
+    match = _UNRECOGNIZED_WORD_RE.search(movetext)
+    return match.group(0) if match else None
+
+class _MoveExtractor(chess.pgn.BaseVisitor):
+    """
+    PGN visitor that builds Move records while the movetext is being parsed,
+    without building a game tree. Variations are skipped.
+    """
+
+    def begin_game(self) -> None:
+        self.headers = chess.pgn.Headers()
+        self.errors: List[Exception] = []
+        self.moves: List[Move] = []
+        self.move_number = 1
+        self.current_move = Move.construct_empty(self.move_number)
+        self.pending_white: Optional[bool] = None
+        self.ply_count = 0
+
+    def begin_headers(self) -> chess.pgn.Headers:
+        return self.headers
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def visit_result(self, result: str) -> None:
+        if self.headers.get("Result", "*") == "*":
+            self.headers["Result"] = result
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move) -> None:
+        # Called before the move is pushed: record SAN, UCI and captures.
+        # board.san() already checks for check/checkmate to add the "+"/"#"
+        # suffix, so reuse that instead of generating legal moves again.
+        self.ply_count += 1
+        if self.ply_count > MAX_PLIES:
+            raise HTTPException(status_code=413, detail=f"PGN has more than {MAX_PLIES} half-moves")
+        current_move = self.current_move
+        san_move = board.san(move)
+        captured_piece = board.piece_at(move.to_square)
+        captured = str(captured_piece) if captured_piece else None
+        is_checkmate = san_move.endswith("#")
+        is_check = is_checkmate or san_move.endswith("+")
+
+        if board.turn == chess.WHITE:
+            current_move.white = san_move
+            current_move.white_uci = move.uci()
+            current_move.captured_piece_white = captured
+            current_move.is_check_white = is_check
+            current_move.is_checkmate_white = is_checkmate
+            current_move.full_move = f"{self.move_number}. {san_move}"
+        else:
+            current_move.black = san_move
+            current_move.black_uci = move.uci()
+            current_move.captured_piece_black = captured
+            current_move.is_check_black = is_check
+            current_move.is_checkmate_black = is_checkmate
+            current_move.full_move = f"{self.move_number}. {current_move.white} {san_move}"
+        self.pending_white = board.turn == chess.WHITE
+
+    def visit_board(self, board: chess.Board) -> None:
+        # Called after each move is pushed: record the resulting position
+        if self.pending_white is None:
+            return
+        current_move = self.current_move
+        fen_now = board.fen()
+
+        if self.pending_white:
+            current_move.position_after_white = fen_now
+        else:
+            current_move.position_after_black = fen_now
+            current_move.position_fen = fen_now
+            self.moves.append(current_move)
+            self.move_number += 1
+            self.current_move = Move.construct_empty(self.move_number)
+        self.pending_white = None
+
+    def handle_error(self, error: Exception) -> None:
+        logger.error(f"Error parsing PGN: {str(error)}")
+        self.errors.append(error)
+
+    def end_game(self) -> None:
+        # Handle last move if it's only white's move
+        current_move = self.current_move
+        if current_move.white and not current_move.black:
+            current_move.position_fen = current_move.position_after_white
+            self.moves.append(current_move)
+
+    def result(self) -> "_MoveExtractor":
+        return self
+
 def extract_moves_from_pgn(pgn_content: str) -> Tuple[List[Move], Dict]:
     """Extract moves from PGN content and return them in a structured format."""
     try:
@@ -14,107 +125,41 @@ def extract_moves_from_pgn(pgn_content: str) -> Tuple[List[Move], Dict]:
         if not pgn_content.strip():
             logger.error("Empty PGN content")
             raise HTTPException(status_code=400, detail="Empty PGN content")
+        if len(pgn_content) > MAX_PGN_LENGTH:
+            logger.error(f"PGN content too large: {len(pgn_content)} characters")
+            raise HTTPException(
+                status_code=413,
+                detail=f"PGN content too large (max {MAX_PGN_LENGTH} characters)"
+            )
+        if not _PGN_START_RE.search(pgn_content):
+            logger.error("Invalid PGN format - no headers or move numbers found")
+            raise HTTPException(status_code=400, detail="Invalid PGN format - no headers or move numbers found")
 
-        game = chess.pgn.read_game(io.StringIO(pgn_content))
+        # Parse the game in a single pass, building moves as they are read
+        handle = io.StringIO(pgn_content)
+        game = chess.pgn.read_game(handle, Visitor=_MoveExtractor)
         if not game:
             logger.error("Invalid PGN format - could not read game")
             raise HTTPException(status_code=400, detail="Invalid PGN format - could not read game")
-        
-        try:
-            # Validate that moves can be parsed
-            moves_list = list(game.mainline_moves())
-            if not moves_list:
-                logger.error("No valid moves found in PGN")
-                raise HTTPException(status_code=400, detail="No valid moves found in PGN")
-        except ValueError as e:
-            logger.error(f"Invalid moves in PGN: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid moves in PGN: {str(e)}")
-        
-        board = game.board()
-        moves = []
-        move_number = 1
-        current_move = {
-            "number": move_number,
-            "white": None,
-            "black": None,
-            "position_after_white": None,
-            "position_after_black": None,
-            "white_uci": None,
-            "black_uci": None,
-            "full_move": f"{move_number}.",
-            "position_fen": board.fen(),
-            "captured_piece_white": None,
-            "captured_piece_black": None,
-            "is_check_white": False,
-            "is_check_black": False,
-            "is_checkmate_white": False,
-            "is_checkmate_black": False
-        }
-        
-        for node in game.mainline():
-            try:
-                move = node.move
-                if not move:
-                    continue
-                
-                # Get move in both SAN and UCI format
-                san_move = board.san(move)
-                uci_move = move.uci()
-                
-                # Check if a piece was captured
-                captured_piece = board.piece_at(move.to_square)
-                
-                # Make the move
-                board.push(move)
-                
-                # Check for check/checkmate
-                is_check = board.is_check()
-                is_checkmate = board.is_checkmate()
-                
-                if node.turn():  # Black's move
-                    current_move["black"] = san_move
-                    current_move["black_uci"] = uci_move
-                    current_move["position_after_black"] = board.fen()
-                    current_move["captured_piece_black"] = str(captured_piece) if captured_piece else None
-                    current_move["is_check_black"] = is_check
-                    current_move["is_checkmate_black"] = is_checkmate
-                    current_move["full_move"] = f"{move_number}. {current_move['white']} {san_move}"
-                    current_move["position_fen"] = board.fen()
-                    moves.append(Move(**current_move))
-                    move_number += 1
-                    current_move = {
-                        "number": move_number,
-                        "white": None,
-                        "black": None,
-                        "position_after_white": None,
-                        "position_after_black": None,
-                        "white_uci": None,
-                        "black_uci": None,
-                        "full_move": f"{move_number}.",
-                        "position_fen": board.fen(),
-                        "captured_piece_white": None,
-                        "captured_piece_black": None,
-                        "is_check_white": False,
-                        "is_check_black": False,
-                        "is_checkmate_white": False,
-                        "is_checkmate_black": False
-                    }
-                else:  # White's move
-                    current_move["white"] = san_move
-                    current_move["white_uci"] = uci_move
-                    current_move["position_after_white"] = board.fen()
-                    current_move["captured_piece_white"] = str(captured_piece) if captured_piece else None
-                    current_move["is_check_white"] = is_check
-                    current_move["is_checkmate_white"] = is_checkmate
-                    current_move["full_move"] = f"{move_number}. {san_move}"
-            except Exception as e:
-                logger.error(f"Error processing move: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Error processing move: {str(e)}")
-        
-        # Handle last move if it's only white's move
-        if current_move["white"] and not current_move["black"]:
-            moves.append(Move(**current_move))
-        
+
+        # Only look at the text of the game that was read, not any games after it
+        unrecognized = _find_unrecognized_word(pgn_content[:handle.tell()])
+        if unrecognized:
+            logger.error(f"Invalid PGN format - unrecognized movetext: {unrecognized!r}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid PGN format - unrecognized movetext: {unrecognized!r}"
+            )
+        if game.errors:
+            # python-chess stops at the first bad move and keeps the moves before it
+            logger.error(f"Invalid PGN format - {str(game.errors[0])}")
+            raise HTTPException(status_code=400, detail=f"Invalid PGN format - {str(game.errors[0])}")
+
+        moves = game.moves
+        if not moves:
+            logger.error("No valid moves found in PGN")
+            raise HTTPException(status_code=400, detail="No valid moves found in PGN")
+
         # Extract game metadata
         metadata = {
             "opening_name": game.headers.get("Opening", None),
@@ -123,9 +168,11 @@ def extract_moves_from_pgn(pgn_content: str) -> Tuple[List[Move], Dict]:
             "black_player": game.headers.get("Black", None),
             "date": game.headers.get("Date", None)
         }
-        
+
         logger.info(f"Successfully extracted {len(moves)} moves from PGN")
         return moves, metadata
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error extracting moves from PGN: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error extracting moves from PGN: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Error extracting moves from PGN: {str(e)}")
@@ -1,11 +1,12 @@
 import json
 import logging
-from typing import Dict, List
+import orjson
+from typing import BinaryIO, Dict, List, Optional, Tuple
 from fastapi import HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI
+import httpx
 import os
 from dotenv import load_dotenv
-import base64
 from ..models.chess_models import Analysis
 
 # Configure logging
@@ -14,20 +15,28 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client (async, sharing one pooled HTTP client across calls).
+# The client backs off and retries rate-limited and failed requests itself,
+# honouring Retry-After.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "5")),
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+)
 if not client.api_key:
     logger.error("OpenAI API key not found in environment variables!")
 
-async def analyze_game_with_gpt(moves: List) -> Dict:
-    """Analyze the chess game using GPT-4."""
-    try:
-        # Prepare the moves for GPT analysis
-        moves_text = "\n".join([move.full_move for move in moves])
-        logger.info("Prepared moves for GPT analysis")
-        
-        # Create the prompt for GPT-4
-        prompt = f"""You are a chess analysis engine. Analyze the following chess game and provide your analysis in JSON format.
+# Model and prompt revision used for game analysis; bump the version when the
+# analysis prompt changes so cached analyses are not reused
+ANALYSIS_MODEL = "gpt-4-turbo-preview"
+ANALYSIS_PROMPT_VERSION = "1"
+
+# Prompts shared by every request
+_ANALYSIS_SYSTEM = {"role": "system", "content": "You are a chess grandmaster. You must respond with valid JSON only, no other text or formatting."}
+
+_ANALYSIS_PROMPT = """You are a chess analysis engine. Analyze the following chess game and provide your analysis in JSON format.
 IMPORTANT: Respond with ONLY valid JSON - no markdown, no code blocks, no additional text.
 
 Required JSON structure:
@@ -48,45 +57,97 @@ Game moves to analyze:
 
 Remember: Return ONLY the JSON object, nothing else."""
 
-        logger.info("Sending request to OpenAI")
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a chess grandmaster. You must respond with valid JSON only, no other text or formatting."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000,
-            response_format={ "type": "json_object" }  # Enforce JSON response
+_COACH_SYSTEM = {
+    "role": "system",
+    "content": """You are an experienced chess coach and grandmaster. 
+    Provide clear, constructive advice and explain concepts in an easy-to-understand way. 
+    Respond with ONLY a valid JSON object with this exact structure:
+    {
+        "text_response": "Main coaching response with markdown formatting",
+        "suggestions": ["Suggestion 1", "Suggestion 2", "Suggestion 3"],
+        "next_steps": ["Action 1", "Action 2"],
+        "evaluation": "Brief evaluation"
+    }
+
+    Format the text_response using markdown:
+
+    1. Use '### Analysis' for position or question analysis
+    2. Use '### Key Points' for main takeaways
+    3. Use '### Strategy' for long-term plans
+    4. Use '### Tactics' for immediate opportunities
+    5. Use '### Suggestions' for concrete moves or ideas
+    6. Use '### Evaluation' for position assessment
+    
+    Use numbered lists (1., 2., etc.) for sequential points
+    Use **bold** for emphasis on important terms
+    Keep paragraphs focused and well-structured
+    Ensure all strings are properly escaped
+    """
+}
+
+def _build_analysis_request(moves: List) -> Dict:
+    """Build the chat completion request body for analyzing a game."""
+    # Prepare the moves for GPT analysis
+    moves_text = "\n".join([move.full_move for move in moves])
+    
+    # Create the prompt for GPT-4
+    prompt = _ANALYSIS_PROMPT.format(moves_text=moves_text)
+
+    return {
+        "model": ANALYSIS_MODEL,
+        "messages": [
+            _ANALYSIS_SYSTEM,
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 2000,
+        "response_format": { "type": "json_object" }  # Enforce JSON response
+    }
+
+def _parse_analysis_content(content: Optional[str]) -> Dict:
+    """Parse and validate the JSON analysis returned by GPT."""
+    if content is None:
+        # Refusals and content-filter stops come back without message content
+        logger.error("GPT response has no content")
+        raise HTTPException(status_code=500, detail="GPT response has no content")
+    content = content.strip()
+    try:
+        # Try to parse the response as JSON
+        logger.info("Attempting to parse GPT response as JSON")
+        analysis_dict = orjson.loads(content)
+        # Ensure required fields are present
+        if not isinstance(analysis_dict, dict):
+            raise ValueError("Response is not a dictionary")
+        if "summary" not in analysis_dict or "key_moments" not in analysis_dict:
+            raise ValueError("Missing required fields in response")
+        logger.info("Successfully parsed GPT response")
+        return analysis_dict
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse GPT response as JSON: {str(e)}")
+        logger.error(f"Raw response: {content}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to parse GPT response as JSON. Response: {content[:100]}..."
+        )
+    except ValueError as e:
+        logger.error(f"Invalid response format: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Invalid response format: {str(e)}"
         )
+
+async def analyze_game_with_gpt(moves: List) -> Dict:
+    """Analyze the chess game using GPT-4."""
+    try:
+        request_body = _build_analysis_request(moves)
+        logger.info("Prepared moves for GPT analysis")
+
+        logger.info("Sending request to OpenAI")
+        response = await client.chat.completions.create(**request_body)
         logger.info("Received response from OpenAI")
 
         # Extract the content and ensure it's valid JSON
-        content = response.choices[0].message.content.strip()
-        try:
-            # Try to parse the response as JSON
-            logger.info("Attempting to parse GPT response as JSON")
-            analysis_dict = json.loads(content)
-            # Ensure required fields are present
-            if not isinstance(analysis_dict, dict):
-                raise ValueError("Response is not a dictionary")
-            if "summary" not in analysis_dict or "key_moments" not in analysis_dict:
-                raise ValueError("Missing required fields in response")
-            logger.info("Successfully parsed GPT response")
-            return analysis_dict
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse GPT response as JSON: {str(e)}")
-            logger.error(f"Raw response: {content}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to parse GPT response as JSON. Response: {content[:100]}..."
-            )
-        except ValueError as e:
-            logger.error(f"Invalid response format: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Invalid response format: {str(e)}"
-            )
+        return _parse_analysis_content(response.choices[0].message.content)
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
         raise HTTPException(
@@ -94,135 +155,161 @@ Remember: Return ONLY the JSON object, nothing else."""
             detail=f"Analysis failed: {str(e)}"
         )
 
-async def get_coaching_response(messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
-    """Get coaching response from OpenAI."""
+async def create_analysis_batch(games: List[List]) -> Tuple[str, str]:
+    """Submit analyses for several games as one OpenAI batch job and return its id and status."""
     try:
-        # Add formatting instructions to the system message
-        system_message = """You are an experienced chess coach and grandmaster. 
-        Provide clear, constructive advice and explain concepts in an easy-to-understand way. 
-        Format your responses using markdown:
-
-        1. Use '### Analysis' for position or question analysis
-        2. Use '### Key Points' for main takeaways
-        3. Use '### Strategy' for long-term plans
-        4. Use '### Tactics' for immediate opportunities
-        5. Use '### Suggestions' for concrete moves or ideas
-        6. Use '### Evaluation' for position assessment
-        
-        Use numbered lists (1., 2., etc.) for sequential points
-        Use **bold** for emphasis on important terms
-        Keep paragraphs focused and well-structured
-        """
-
-        # Update the system message in the messages list
-        if messages and messages[0]["role"] == "system":
-            messages[0]["content"] = system_message
-        else:
-            messages.insert(0, {"role": "system", "content": system_message})
+        # One JSONL line per game, with the same body as the single-game path
+        lines = [
+            orjson.dumps({
+                "custom_id": f"game-{index}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": _build_analysis_request(moves)
+            })
+            for index, moves in enumerate(games)
+        ]
+        batch_file = await client.files.create(
+            file=("analyses.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info(f"Created analysis batch {batch.id} for {len(games)} games")
+        return batch.id, batch.status
+    except Exception as e:
+        logger.error(f"Failed to create analysis batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to create analysis batch: {str(e)}")
+
+async def get_analysis_batch(batch_id: str) -> Tuple[str, Optional[Dict[int, Dict]]]:
+    """
+    Fetch the status of an analysis batch job.
+    Returns the batch status and, once completed, the parsed analyses keyed by game index.
+    """
+    try:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status != "completed" or not batch.output_file_id:
+            return batch.status, None
+
+        output = await client.files.content(batch.output_file_id)
+        analyses = {}
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            # A malformed line only fails its own game; games missing from the
+            # result are reported as failed by the caller
+            try:
+                result = orjson.loads(line)
+                index = int(result["custom_id"].split("-", 1)[1])
+            except (orjson.JSONDecodeError, KeyError, IndexError, TypeError, ValueError) as e:
+                logger.error(f"Batch {batch_id} has an unreadable output line: {str(e)}")
+                continue
+            try:
+                response = result.get("response") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    logger.error(f"Batch {batch_id} game {index} failed: {result.get('error') or response}")
+                    continue
+                content = response["body"]["choices"][0]["message"]["content"]
+                analyses[index] = _parse_analysis_content(content)
+            except HTTPException as e:
+                logger.error(f"Batch {batch_id} game {index} returned an invalid analysis: {e.detail}")
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                logger.error(f"Batch {batch_id} game {index} returned an unexpected response body: {str(e)}")
+        return batch.status, analyses
+    except Exception as e:
+        logger.error(f"Failed to retrieve analysis batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve analysis batch: {str(e)}")
 
-        response = client.chat.completions.create(
+async def get_coaching_response(messages: List[Dict[str, str]], temperature: float = 0.7) -> Dict:
+    """Get a structured coaching response from OpenAI in a single call."""
+    try:
+        # Replace any caller-provided system message with the coaching instructions
+        payload = [_COACH_SYSTEM] + [m for m in messages if m["role"] != "system"]
+
+        response = await client.chat.completions.create(
             model="gpt-4-turbo-preview",
-            messages=messages,
+            messages=payload,
             temperature=temperature,
-            max_tokens=1000
+            max_tokens=1000,
+            response_format={ "type": "json_object" }
         )
-        return response.choices[0].message.content
+        return structure_coaching_response(response.choices[0].message.content)
     except Exception as e:
         logger.error(f"Error getting coaching response: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def structure_coaching_response(coaching_text: str) -> Dict:
-    """Structure the coaching response into a consistent format."""
-    try:
-        analysis_prompt = """Convert the following coaching advice into a JSON object with this exact structure:
-{
-    "text_response": "Main coaching response with markdown formatting",
-    "suggestions": ["Suggestion 1", "Suggestion 2", "Suggestion 3"],
-    "next_steps": ["Action 1", "Action 2"],
-    "evaluation": "Brief evaluation"
-}
+def _as_string_list(value) -> List[str]:
+    """Coerce a coaching list field to a list of strings, dropping null items."""
+    if not isinstance(value, list):
+        value = [value]
+    return [item if isinstance(item, str) else str(item) for item in value if item is not None]
 
-Original coaching content:
-"""
+def structure_coaching_response(coaching_text: str) -> Dict:
+    """Parse the JSON coaching response into a consistent format."""
+    try:
+        parsed_response = orjson.loads(coaching_text.strip())
         
-        analysis_prompt += coaching_text
+        # Validate the response structure
+        if not isinstance(parsed_response, dict):
+            raise ValueError("Response is not a dictionary")
+        required_fields = ["text_response", "suggestions"]
+        for field in required_fields:
+            if parsed_response.get(field) is None:
+                raise ValueError(f"Missing required field: {field}")
+        if not isinstance(parsed_response["text_response"], str):
+            raise ValueError("text_response is not a string")
         
-        structured_response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a JSON formatter. Format the chess coaching advice into a valid JSON object with the exact structure specified. Ensure all strings are properly escaped."
-                },
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1000,
-            response_format={ "type": "json_object" }
-        )
+        # Ensure suggestions (and next_steps if present) are lists of strings
+        parsed_response["suggestions"] = _as_string_list(parsed_response["suggestions"])
+        if parsed_response.get("next_steps") is None:
+            parsed_response.pop("next_steps", None)
+        else:
+            parsed_response["next_steps"] = _as_string_list(parsed_response["next_steps"])
         
-        try:
-            content = structured_response.choices[0].message.content.strip()
-            parsed_response = json.loads(content)
-            
-            # Validate the response structure
-            required_fields = ["text_response", "suggestions"]
-            for field in required_fields:
-                if field not in parsed_response:
-                    raise ValueError(f"Missing required field: {field}")
-                    
-            # Ensure suggestions is a list
-            if not isinstance(parsed_response["suggestions"], list):
-                parsed_response["suggestions"] = [parsed_response["suggestions"]]
-                
-            # Ensure next_steps is a list if present
-            if "next_steps" in parsed_response and not isinstance(parsed_response["next_steps"], list):
-                parsed_response["next_steps"] = [parsed_response["next_steps"]]
-                
-            return parsed_response
+        # Treat a null evaluation as absent
+        if parsed_response.get("evaluation") is None:
+            parsed_response.pop("evaluation", None)
+        elif not isinstance(parsed_response["evaluation"], str):
+            parsed_response["evaluation"] = str(parsed_response["evaluation"])
             
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {str(e)}")
-            logger.error(f"Raw response content: {content}")
-            # Provide a fallback response
-            return {
-                "text_response": coaching_text,
-                "suggestions": ["Please review the advice above"],
-                "next_steps": ["Consider the main points mentioned"],
-                "evaluation": "Unable to structure the response"
-            }
-            
-    except Exception as e:
+        return parsed_response
+        
+    except (json.JSONDecodeError, ValueError) as e:
         logger.error(f"Error structuring coaching response: {str(e)}")
-        # Return a simplified response rather than raising an exception
+        logger.error(f"Raw response content: {coaching_text}")
+        # Wrap the raw text rather than raising an exception
         return {
             "text_response": coaching_text,
-            "suggestions": ["Please review the advice provided"],
-            "next_steps": ["Consider the key points mentioned"],
-            "evaluation": "Error structuring the response"
+            "suggestions": ["Please review the advice above"],
+            "next_steps": ["Consider the main points mentioned"],
+            "evaluation": "Unable to structure the response"
         }
 
-async def text_to_speech(text: str, voice: str = "alloy") -> str:
-    """Convert text to speech using OpenAI's TTS API."""
+async def text_to_speech(text: str, voice: str = "alloy") -> bytes:
+    """Convert text to speech using OpenAI's TTS API. Returns raw MP3 bytes."""
     try:
-        speech_response = client.audio.speech.create(
+        speech_response = await client.audio.speech.create(
             model="tts-1",
             voice=voice,
             input=text
         )
         
-        audio_data = speech_response.content
-        return base64.b64encode(audio_data).decode('utf-8')
+        return speech_response.content
     except Exception as e:
         logger.error(f"Error in text-to-speech conversion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def speech_to_text(audio_content: bytes) -> str:
-    """Convert speech to text using OpenAI's Whisper API."""
+async def speech_to_text(audio_file: BinaryIO, filename: str = "audio.wav") -> str:
+    """
+    Convert speech to text using OpenAI's Whisper API.
+    The audio is streamed from the file object instead of being read into memory.
+    """
     try:
-        transcript_response = client.audio.transcriptions.create(
+        transcript_response = await client.audio.transcriptions.create(
             model="whisper-1",
-            file=("audio.wav", audio_content, "audio/wav")
+            file=(filename, audio_file, "audio/wav")
         )
         return transcript_response.text
     except Exception as e:
@@ -232,7 +319,7 @@ async def speech_to_text(audio_content: bytes) -> str:
 async def check_openai_connection() -> bool:
     """Test the OpenAI connection."""
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4-turbo-preview",
             messages=[
                 {"role": "system", "content": "You are a chess analyzer."},
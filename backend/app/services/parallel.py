@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Iterable, List, Optional
+
+# Limits for fanning out OpenAI requests (0 disables the corresponding rate limit)
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+RPM = int(os.getenv("RPM", "500"))
+TPM = int(os.getenv("TPM", "0"))
+
+class _TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1) -> None:
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(
+                    self.capacity,
+                    self.available + (now - self.updated) * self.capacity / 60
+                )
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.capacity)
+
+async def run_bounded(
+    coros: Iterable[Awaitable[Any]],
+    max_concurrency: int = MAX_CONCURRENCY,
+    rpm: int = RPM,
+    tpm: int = TPM,
+    tokens_per_request: int = 0,
+    return_exceptions: bool = False
+) -> List[Any]:
+    """
+    Await coroutines with at most `max_concurrency` in flight, starting no more
+    than `rpm` requests per minute. The `tpm` token limit only applies when the
+    caller passes `tokens_per_request`, its estimate of the tokens (prompt plus
+    max_tokens) each request uses; with the default of 0 it is ignored.
+    Results are returned in the order of the input.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    request_bucket: Optional[_TokenBucket] = _TokenBucket(rpm) if rpm > 0 else None
+    token_bucket: Optional[_TokenBucket] = (
+        _TokenBucket(tpm) if tpm > 0 and tokens_per_request > 0 else None
+    )
+
+    async def run_one(coro: Awaitable[Any]) -> Any:
+        async with semaphore:
+            if request_bucket:
+                await request_bucket.acquire()
+            if token_bucket:
+                await token_bucket.acquire(tokens_per_request)
+            return await coro
+
+    return await asyncio.gather(
+        *(run_one(coro) for coro in coros),
+        return_exceptions=return_exceptions
+    )
@@ -0,0 +1,73 @@
+import time
+import pytest
+from fastapi import HTTPException
+from app.services.chess_service import MAX_PGN_LENGTH, extract_moves_from_pgn
+
+GAME = """[Event "Test Game"]
+[White "Player 1"]
+[Black "Player 2"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O 1-0
+"""
+
+def _status(pgn: str) -> int:
+    with pytest.raises(HTTPException) as error:
+        extract_moves_from_pgn(pgn)
+    return error.value.status_code
+
+def test_extracts_moves_and_metadata():
+    moves, metadata = extract_moves_from_pgn(GAME)
+    assert [move.full_move for move in moves] == [
+        "1. e4 e5", "2. Nf3 Nc6", "3. Bb5 a6", "4. Ba4 Nf6", "5. O-O"
+    ]
+    assert moves[-1].black is None
+    assert metadata["white_player"] == "Player 1"
+    assert metadata["result"] == "1-0"
+
+def test_skips_comments_nags_and_variations():
+    pgn = '[Opening "Italian"]\n\n1. e4 {best by test} e5 (1... c5 2. Nf3) 2. Nf3 $1 Nc6!? ; rest of line\n3. Bc4 *'
+    moves, metadata = extract_moves_from_pgn(pgn)
+    assert [move.full_move for move in moves] == ["1. e4 e5", "2. Nf3 Nc6", "3. Bc4"]
+    assert metadata["opening_name"] == "Italian"
+
+def test_accepts_leading_bom():
+    moves, metadata = extract_moves_from_pgn("\ufeff" + GAME)
+    assert len(moves) == 5
+    assert metadata["white_player"] == "Player 1"
+
+def test_reads_only_the_first_game():
+    pgn = GAME + '\n[Event "Second"]\n\n1. d4 d5 Resigns 0-1\n'
+    moves, metadata = extract_moves_from_pgn(pgn)
+    assert len(moves) == 5
+    assert metadata["result"] == "1-0"
+
+def test_rejects_illegal_san():
+    assert _status("1. e4 e5 2. Ke3 Nf6 *") == 400
+
+def test_rejects_unrecognized_movetext():
+    assert _status("1. e4 e5 invalid moves") == 400
+
+def test_rejects_empty_and_non_pgn_input():
+    assert _status("   ") == 400
+    assert _status("hello world") == 400
+
+def test_rejects_oversized_input():
+    assert _status("1. e4 e5 " + " " * MAX_PGN_LENGTH) == 413
+
+@pytest.mark.parametrize("padding", [
+    "\n" * (MAX_PGN_LENGTH - 100),
+    "\r\n" * (MAX_PGN_LENGTH // 2 - 100),
+    " \n" * (MAX_PGN_LENGTH // 2 - 100),
+], ids=["lf", "crlf", "space-lf"])
+def test_trailing_whitespace_is_parsed_in_linear_time(padding):
+    start = time.monotonic()
+    moves, _ = extract_moves_from_pgn("1. e4 e5" + padding)
+    assert len(moves) == 1
+    assert time.monotonic() - start < 2
+
+def test_long_digit_run_is_scanned_in_linear_time():
+    start = time.monotonic()
+    moves, _ = extract_moves_from_pgn("1. e4 e5 " + "1" * 100_000)
+    assert len(moves) == 1
+    assert time.monotonic() - start < 2
@@ -0,0 +1,59 @@
+import asyncio
+import time
+from app.services.parallel import run_bounded
+
+async def _sleep_and_return(value, delay: float, tracker: dict = None):
+    if tracker is not None:
+        tracker["active"] += 1
+        tracker["peak"] = max(tracker["peak"], tracker["active"])
+    await asyncio.sleep(delay)
+    if tracker is not None:
+        tracker["active"] -= 1
+    return value
+
+def test_run_bounded_keeps_input_order():
+    """Results come back in input order even when later coroutines finish first."""
+    delays = [0.05, 0.01, 0.03, 0.0, 0.02]
+    results = asyncio.run(run_bounded(
+        [_sleep_and_return(i, delay) for i, delay in enumerate(delays)],
+        max_concurrency=5,
+        rpm=0
+    ))
+    assert results == [0, 1, 2, 3, 4]
+
+def test_run_bounded_caps_concurrency():
+    """No more than max_concurrency coroutines run at the same time."""
+    tracker = {"active": 0, "peak": 0}
+    results = asyncio.run(run_bounded(
+        [_sleep_and_return(i, 0.01, tracker) for i in range(10)],
+        max_concurrency=3,
+        rpm=0
+    ))
+    assert results == list(range(10))
+    assert tracker["peak"] == 3
+
+def test_run_bounded_paces_requests_per_minute():
+    """Once the initial burst of `rpm` starts is used up, starts are paced at rpm / 60 per second."""
+    # 1200 RPM allows a burst of 1200 starts, then one every 50 ms
+    start = time.monotonic()
+    results = asyncio.run(run_bounded(
+        [_sleep_and_return(i, 0) for i in range(1204)],
+        max_concurrency=2000,
+        rpm=1200
+    ))
+    elapsed = time.monotonic() - start
+    assert results == list(range(1204))
+    assert 0.15 <= elapsed < 1.0
+
+def test_run_bounded_returns_exceptions():
+    """With return_exceptions=True a failing coroutine doesn't cancel the others."""
+    async def fail():
+        raise ValueError("boom")
+
+    results = asyncio.run(run_bounded(
+        [_sleep_and_return(0, 0), fail(), _sleep_and_return(2, 0)],
+        rpm=0,
+        return_exceptions=True
+    ))
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], ValueError)
@@ -211,10 +211,8 @@ export default function ChessCoaching({ gameContext }: ChessCoachingProps) {
 
           // Handle the structured response
           if (response.data.coaching) {
-            // Convert base64 audio to audio element
-            const audio = new Audio(
-              `data:audio/mp3;base64,${response.data.coaching.audio_response}`
-            );
+            // Play the spoken response served by the backend
+            const audio = new Audio(response.data.coaching.tts_url);
             await audio.play();
 
             setMessages((prev) => [